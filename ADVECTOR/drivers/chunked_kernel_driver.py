@@ -124,6 +124,7 @@ def execute_chunked_kernel_computation(
         print(f"\tKernel Execution:     {execution_time:10.3f}s")
         print(f"\tOutput Writing:       {output_time:10.3f}s")
 
+    output_writer.close()  # writes out anything still buffered, completing the outputfiles
     return output_writer.paths
 
 
@@ -1,18 +1,128 @@
+import threading
 from abc import ABC, abstractmethod
+from concurrent.futures import Future, ThreadPoolExecutor
 from pathlib import Path
-from typing import Dict, List
+from typing import Dict, List, Optional, Tuple
 
 import netCDF4
 import numpy as np
 import xarray as xr
+from xarray.coding.strings import CharacterArrayCoder
 
 import ADVECTOR
 from ..enums.forcings import Forcing
 from ..kernel_wrappers.kernel_constants import EXIT_CODES
 
+# share xarray's lock, so our writes never overlap its reads of the forcing data.
+# It is private to xarray; without it, at least serialize our own library calls.
+try:
+    from xarray.backends.netCDF4_ import NETCDF4_PYTHON_LOCK
+except ImportError:
+    NETCDF4_PYTHON_LOCK = threading.Lock()
+
 SOURCEFILE_GROUP_NAME = "sourcefile"
 MODEL_DOMAIN_GROUP_NAME = "model_domain"
 CONFIGFILE_GROUP_NAME = "configfile"
+# target size of each hdf5 chunk of a (p_id, time) variable
+TRAJECTORY_CHUNK_BYTES = 2**18
+# largest estimated trajectory footprint for which fits_in_memory recommends keep_in_memory mode
+IN_MEMORY_THRESHOLD_BYTES = 2**30
+_EXIT_CODES_STR = str(
+    {code: meaning for code, meaning in EXIT_CODES.items() if code >= 0}
+)
+
+
+def _dt64_to_epoch_seconds(a: np.ndarray) -> np.ndarray:
+    """convert datetime64 array to int64 seconds since epoch; a pure reinterpret if already in seconds"""
+    return a.astype("datetime64[s]", copy=False).view(np.int64)
+
+
+def _dt64_to_year(a: np.ndarray) -> np.ndarray:
+    """calendar year of each element of a datetime64 array"""
+    return a.astype("datetime64[Y]").astype(int) + 1970
+
+
+def _take_timesteps(pieces: List[np.ndarray], start: int, stop: int) -> np.ndarray:
+    """timesteps [start, stop) of arrays split along their last (time) axis; a view if all lie in one piece"""
+    selected = []
+    offset = 0
+    for piece in pieces:
+        length = piece.shape[-1]
+        lo, hi = max(start - offset, 0), min(stop - offset, length)
+        if lo < hi:
+            selected.append(piece[..., lo:hi])
+        offset += length
+    return selected[0] if len(selected) == 1 else np.concatenate(selected, axis=-1)
+
+
+def _storage_encoding(var: xr.Variable) -> dict:
+    """createVariable kwargs which preserve the chunking/compression a variable was read with"""
+    encoding = var.encoding
+    storage = {}
+    if encoding.get("zlib"):
+        storage.update(
+            zlib=True,
+            complevel=encoding.get("complevel", 4),
+            shuffle=encoding.get("shuffle", False),
+        )
+    chunksizes = encoding.get("chunksizes")
+    # as xarray does: concatenation/selection may have reshaped the variable since it was read
+    if (
+        chunksizes
+        and len(chunksizes) == var.ndim
+        and encoding.get("original_shape") == var.shape
+    ):
+        storage["chunksizes"] = chunksizes
+    return storage
+
+
+def _copy_xr_to_nc4_group(ds: xr.Dataset, grp: netCDF4.Group):
+    """write an in-memory xr.Dataset into an open netCDF4 group, applying CF encoding (e.g. to datetimes)"""
+    variables, attrs = xr.conventions.cf_encoder(ds.variables, ds.attrs)
+    # store fixed-width byte strings as character arrays, as xarray's netCDF4 backend does
+    variables = {
+        name: (
+            CharacterArrayCoder().encode(var, name=name)
+            if var.dtype.kind == "S"
+            else var
+        )
+        for name, var in variables.items()
+    }
+    grp.setncatts(attrs)
+    # encoding may add dimensions (e.g. the character axis of fixed-width strings)
+    for var in variables.values():
+        for dim, size in zip(var.dims, var.shape):
+            if dim not in grp.dimensions:
+                grp.createDimension(dim, size)
+    for name, var in variables.items():
+        var_attrs = dict(var.attrs)
+        is_string = var.dtype.kind in "OU"
+        nc_var = grp.createVariable(
+            name,
+            str if is_string else var.dtype,
+            var.dims,
+            fill_value=var_attrs.pop("_FillValue", None),
+            **({} if is_string else _storage_encoding(var)),
+        )
+        nc_var.setncatts(var_attrs)
+        if 0 in var.shape:
+            continue
+        # data is already CF-encoded; write it raw, without netCDF4's masked array/string handling
+        nc_var.set_auto_maskandscale(False)
+        nc_var.set_auto_chartostring(False)
+        nc_var[...] = var.values
+
+
+def fits_in_memory(
+    num_particles: int, num_saved_timesteps: int, num_trajectory_variables: int
+) -> bool:
+    """
+    whether a run's trajectories are small enough for OutputWriter's keep_in_memory mode
+    :param num_trajectory_variables: variables along (p_id, time); 2 in 2D (lon, lat), 3 in 3D (lon, lat, depth)
+    """
+    # 8 bytes per element: the float32 trajectories, plus the copy made when they are concatenated for writing
+    estimate = num_particles * num_saved_timesteps * num_trajectory_variables * 8
+    return estimate < IN_MEMORY_THRESHOLD_BYTES
 
 
 class OutputWriter(ABC):
@@ -25,6 +135,10 @@ class OutputWriter(ABC):
         api_entry: str,
         api_arguments: dict,
         overwrite_existing_files: bool,
+        compression_level: int = 1,
+        chunk_timesteps: int = 64,
+        buffer_timesteps: Optional[int] = None,
+        keep_in_memory: bool = False,
     ):
         """
         :param out_dir: directory to save outputfiles
@@ -33,6 +147,17 @@ class OutputWriter(ABC):
         :param forcing_data: xr.Datasets containing forcing datasets (e.g. currents, wind...)
         :param api_entry: the function where this is being called from (for traceability)
         :param api_arguments: dictionary containing info on the top-level API call
+        :param compression_level: zlib deflate level (0-9) applied to the trajectory variables; 0 disables compression.
+            Higher levels trade cpu time for smaller outputfiles.
+        :param chunk_timesteps: length of the time axis of each hdf5 chunk of the trajectory variables.
+            The particle axis is then sized so each chunk holds roughly TRAJECTORY_CHUNK_BYTES.
+        :param buffer_timesteps: appended chunks are held in memory until at least this many timesteps have
+            accumulated, then written to disk together by a background thread, overlapping with kernel execution.
+            Only whole hdf5 chunks along time are written; the remainder stays buffered. Defaults to chunk_timesteps.
+        :param keep_in_memory: if True, hold each year's trajectories in memory, then write every variable of the
+            outputfile once, when the year rolls over or the writer is closed.  This skips the append overhead of
+            streaming, but is only for runs small enough to fit in RAM (see fits_in_memory); note that nothing of
+            the current year reaches disk until then, so a crash loses it.
         """
         if out_dir.exists() and any(out_dir.iterdir()):
             print(
@@ -49,6 +174,7 @@ class OutputWriter(ABC):
         self.basename = basename
         self.current_year = None
         self.paths = []
+        self._ds: Optional[netCDF4.Dataset] = None
 
         self.sourcefile = sourcefile
         self.forcing_meta = {
@@ -57,6 +183,26 @@ class OutputWriter(ABC):
         }
         self.api_entry = api_entry
         self.api_arguments = api_arguments
+        self.compression_level = compression_level
+        self.chunk_timesteps = chunk_timesteps
+        self.buffer_timesteps = (
+            chunk_timesteps if buffer_timesteps is None else buffer_timesteps
+        )
+        self.keep_in_memory = keep_in_memory
+        # keep_in_memory state: the year's trajectories chunk by chunk, and its latest chunk minus the trajectories
+        self._held: List[Dict[str, np.ndarray]] = []
+        self._held_static: Optional[xr.Dataset] = None
+        self._buf = self._empty_buffer()
+        self._buf_rows = 0
+        self._buf_exit_code: Optional[np.ndarray] = None
+        self._last_exit_codes: Optional[np.ndarray] = None  # as written to disk
+        # per-outputfile state: handles on the appended variables, and length of the time axis on disk
+        # (including any batch in flight on the writer thread)
+        self._vars: Dict[str, netCDF4.Variable] = {}
+        self._t_written = 0
+        # a single worker, so batches are written in order; at most one is in flight at a time
+        self._exec = ThreadPoolExecutor(max_workers=1)
+        self._pending_write: Optional[Future] = None
 
         self.model_domain = self._get_ocean_domain(forcing_data)
 
@@ -70,121 +216,311 @@ class OutputWriter(ABC):
     def _group_names(self) -> List[str]:
         pass
 
+    @property
+    def _trajectory_variables(self) -> List[str]:
+        """names of the variables along (p_id, time)"""
+        return ["lon", "lat"]
+
     @abstractmethod
     def _get_ocean_domain(self, forcing_data: Dict[Forcing, xr.Dataset]) -> xr.Dataset:
         pass
 
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        try:
+            self.close()
+        finally:
+            self._exec.shutdown()
+
+    def close(self):
+        """flush any buffered chunks, then close the handle on the current outputfile, if one is open"""
+        self._write_held()
+        self._flush()
+        self._wait_for_write()
+        self._vars = {}
+        if self._ds is not None:
+            self._ds.close()
+            self._ds = None
+
+    @property
+    def _dataset(self) -> netCDF4.Dataset:
+        """handle on the current outputfile, held open until the year rolls over"""
+        if self._ds is None:
+            self._ds = netCDF4.Dataset(self.paths[-1], mode="a")
+            self._ds.set_fill_off()  # every appended element is written explicitly
+        return self._ds
+
     def _set_current_year(self, year: int):
+        self.close()
         self.current_year = year
         self.paths.append(self.folder_path / f"{self.basename}_{year}.nc")
 
+    def _trajectory_storage(self, chunk: xr.Dataset, name: str) -> dict:
+        """createVariable kwargs controlling chunking/compression of variables along (p_id, time)"""
+        chunk_p = TRAJECTORY_CHUNK_BYTES // (
+            chunk[name].dtype.itemsize * self.chunk_timesteps
+        )
+        storage = {
+            "chunksizes": (max(1, min(len(chunk.p_id), chunk_p)), self.chunk_timesteps)
+        }
+        if self.compression_level > 0:
+            storage.update(zlib=True, complevel=self.compression_level, shuffle=True)
+        return storage
+
     def write_output_chunk(self, chunk: xr.Dataset):
-        beginning_year = chunk.time.dt.year.values[0]
-        end_year = chunk.time.dt.year.values[-1]
+        times = chunk.time.values
+        beginning_year, end_year = _dt64_to_year(times[[0, -1]])
+        if beginning_year != end_year:
+            years = _dt64_to_year(times)
 
         for year in range(beginning_year, end_year + 1):
-            chunk_year = chunk.isel({"time": chunk.time.dt.year == year})
-            if year != self.current_year:
+            if beginning_year == end_year:
+                chunk_year = chunk  # common case; no need to copy out a selection
+            else:
+                # time is ascending, so each year is a contiguous slice
+                start, stop = np.searchsorted(years, [year, year + 1])
+                chunk_year = chunk.isel({"time": slice(start, stop)})
+            if self.keep_in_memory:
+                if year != self.current_year:
+                    self._set_current_year(year)
+                self._hold_chunk(chunk_year)
+            elif year != self.current_year:
                 self._set_current_year(year)
                 self._write_first_chunk(chunk_year)
                 self._copy_unexpected_variables(chunk_year)
+                self._ds.sync()
             else:
                 self._append_chunk(chunk_year)
 
-    def _write_first_chunk(self, chunk: xr.Dataset):
-        with netCDF4.Dataset(self.paths[-1], mode="w") as ds:
-            # --- INITIALIZE PARTICLE TRAJECTORIES IN ROOT GROUP --- #
-            ds.title = self._dataset_title
-            ds.description = (
-                "This file's root group contains timeseries location data "
-                "for particles run through ADVECTOR.  This file also contains "
-                "several other self-describing groups: "
-                f"{self._group_names}."
-            )
-            ds.institution = "The Ocean Cleanup"
-            ds.source = f"ADVECTOR Version {ADVECTOR.__version__}"
-            ds.arguments = (
-                f"The arguments of the call to {self.api_entry} which produced this "
-                f"file are: {str(self.api_arguments)}"
+    def _hold_chunk(self, chunk: xr.Dataset):
+        """keep_in_memory mode: hold onto only what the outputfile will need"""
+        along_time = ["time"] + self._trajectory_variables
+        # a selection out of a chunk spanning years is copied, so the rest of that chunk can be freed
+        self._held.append(
+            {name: np.ascontiguousarray(chunk[name].values) for name in along_time}
+        )
+        # the latest exit codes are the ones which end up in the outputfile
+        self._held_static = chunk.drop_vars(along_time)
+
+    def _write_held(self):
+        """write the year held in memory (in keep_in_memory mode) out as the current outputfile, in one go"""
+        if not self._held:
+            return
+        held, self._held = self._held, []
+        along_time = {
+            name: (
+                held[0][name]
+                if len(held) == 1
+                else np.concatenate([h[name] for h in held], axis=-1)
             )
+            for name in ["time"] + self._trajectory_variables
+        }
+        del held
+        year = self._held_static.assign(
+            {
+                name: (("p_id", "time"), along_time[name])
+                for name in self._trajectory_variables
+            }
+        ).assign_coords(time=along_time["time"])
+        self._held_static = None
+        self._write_first_chunk(year)
+        self._copy_unexpected_variables(year)
 
-            ds.createDimension("p_id", len(chunk.p_id))
-            ds.createDimension("time", None)  # unlimited dimension
-
-            # Variables along only the static dimension, p_id
-            p_id = ds.createVariable("p_id", chunk.p_id.dtype, ("p_id",))
-            p_id[:] = chunk.p_id.values
-
-            release_date = ds.createVariable("release_date", np.float64, ("p_id",))
-            release_date.units = "seconds since 1970-01-01 00:00:00.0"
-            release_date.calendar = "gregorian"
-            release_date[:] = chunk.release_date.values.astype("datetime64[s]").astype(
-                np.float64
-            )
+    def _write_first_chunk(self, chunk: xr.Dataset):
+        # this handle stays open for subclasses and subsequent appends to use
+        self._ds = ds = netCDF4.Dataset(self.paths[-1], mode="w")
+        # each variable is fully written just after creation; pre-filling would double the writes
+        ds.set_fill_off()
+
+        # --- INITIALIZE PARTICLE TRAJECTORIES IN ROOT GROUP --- #
+        ds.title = self._dataset_title
+        ds.description = (
+            "This file's root group contains timeseries location data "
+            "for particles run through ADVECTOR.  This file also contains "
+            "several other self-describing groups: "
+            f"{self._group_names}."
+        )
+        ds.institution = "The Ocean Cleanup"
+        ds.source = f"ADVECTOR Version {ADVECTOR.__version__}"
+        ds.arguments = (
+            f"The arguments of the call to {self.api_entry} which produced this "
+            f"file are: {str(self.api_arguments)}"
+        )
 
-            exit_code = ds.createVariable("exit_code", np.byte, ("p_id",))
-            exit_code.description = (
-                "These codes are returned by the kernel when unexpected behavior occurs and the"
-                "kernel must be terminated.  Their semantic meaning is provided in the "
-                "'code_to_meaning' attribute of this variable."
-            )
-            exit_code.code_to_meaning = str(
-                {code: meaning for code, meaning in EXIT_CODES.items() if code >= 0}
-            )
-            exit_code[:] = chunk.exit_code.values.astype(np.byte)
+        ds.createDimension("p_id", len(chunk.p_id))
+        ds.createDimension("time", None)  # unlimited dimension
 
-            # Variables that expand between chunks
-            time = ds.createVariable("time", np.float64, ("time",))
-            time.units = "seconds since 1970-01-01 00:00:00.0"
-            time.calendar = "gregorian"
-            time[:] = chunk.time.values.astype("datetime64[s]").astype(np.float64)
+        # Variables along only the static dimension, p_id
+        p_id = ds.createVariable("p_id", chunk.p_id.dtype, ("p_id",))
+        p_id[:] = chunk.p_id.values
 
-            lon = ds.createVariable("lon", chunk.lon.dtype, ("p_id", "time"))
-            lon.units = "Degrees East"
-            lon[:] = chunk.lon.values
+        release_date = ds.createVariable("release_date", np.int64, ("p_id",))
+        release_date.units = "seconds since 1970-01-01 00:00:00.0"
+        release_date.calendar = "gregorian"
+        release_date[:] = _dt64_to_epoch_seconds(chunk.release_date.values)
 
-            lat = ds.createVariable("lat", chunk.lat.dtype, ("p_id", "time"))
-            lat.units = "Degrees North"
-            lat[:] = chunk.lat.values
+        exit_code = ds.createVariable("exit_code", np.byte, ("p_id",))
+        exit_code.description = (
+            "These codes are returned by the kernel when unexpected behavior occurs and the"
+            "kernel must be terminated.  Their semantic meaning is provided in the "
+            "'code_to_meaning' attribute of this variable."
+        )
+        exit_code.code_to_meaning = _EXIT_CODES_STR
+        self._last_exit_codes = chunk.exit_code.values.astype(np.byte)
+        exit_code[:] = self._last_exit_codes
+
+        # Variables that expand between chunks
+        time = ds.createVariable("time", np.int64, ("time",))
+        time.units = "seconds since 1970-01-01 00:00:00.0"
+        time.calendar = "gregorian"
+        time[:] = _dt64_to_epoch_seconds(chunk.time.values)
+        self._t_written = len(chunk.time)
+
+        lon = ds.createVariable(
+            "lon",
+            chunk.lon.dtype,
+            ("p_id", "time"),
+            **self._trajectory_storage(chunk, "lon"),
+        )
+        lon.units = "Degrees East"
+        lon[:] = chunk.lon.values
+
+        lat = ds.createVariable(
+            "lat",
+            chunk.lat.dtype,
+            ("p_id", "time"),
+            **self._trajectory_storage(chunk, "lat"),
+        )
+        lat.units = "Degrees North"
+        lat[:] = chunk.lat.values
 
         # --- SAVE MODEL CONFIGURATION METADATA INTO GROUPS --- #
-        self.model_domain.to_netcdf(self.paths[-1], mode="a", group="model_domain")
-        self.sourcefile.to_netcdf(self.paths[-1], mode="a", group=SOURCEFILE_GROUP_NAME)
+        _copy_xr_to_nc4_group(
+            self.model_domain, ds.createGroup(MODEL_DOMAIN_GROUP_NAME)
+        )
+        _copy_xr_to_nc4_group(self.sourcefile, ds.createGroup(SOURCEFILE_GROUP_NAME))
         for forcing, meta in self.forcing_meta.items():
             meta.attrs["group_description"] = (
                 f"This group contains the coordinates of the fully concatenated {forcing.value} "
                 "dataset, after it has been loaded into ADVECTOR, and global attributes "
                 "from the first file in the dataset."
             )
-            meta.to_netcdf(self.paths[-1], mode="a", group=forcing.name + "_meta")
+            _copy_xr_to_nc4_group(meta, ds.createGroup(forcing.name + "_meta"))
 
     def _copy_unexpected_variables(self, chunk: xr.Dataset):
         """copy any variables along only p_id should be copied over as well"""
-        with netCDF4.Dataset(self.paths[-1], mode="a") as ds:
-            dims_except_p_id = [dim for dim in chunk.dims if dim != "p_id"]
-            for varname in chunk.drop_dims(dims_except_p_id).variables:
-                if varname not in ds.variables:
-                    ds.createVariable(varname, chunk[varname].dtype, ("p_id",))
-                    ds[varname].setncatts(chunk[varname].attrs)
-                    ds[varname][:] = chunk[varname].values
+        ds = self._dataset
+        for varname, var in chunk.variables.items():
+            if var.dims == ("p_id",) and varname not in ds.variables:
+                ds.createVariable(varname, var.dtype, ("p_id",))
+                ds[varname].setncatts(var.attrs)
+                ds[varname][:] = var.values
 
     def _append_chunk(self, chunk: xr.Dataset):
-        with netCDF4.Dataset(self.paths[-1], mode="a") as ds:
-            time = ds.variables["time"]
-            start_t = len(time)
-            time[start_t:] = chunk.time.values.astype("datetime64[s]").astype(
-                np.float64
+        self._buf["time"].append(_dt64_to_epoch_seconds(chunk.time.values))
+        for name in self._trajectory_variables:
+            self._buf[name].append(chunk[name].values)
+        # keep only the most recent codes; by design, nonzero codes cannot change
+        self._buf_exit_code = chunk.exit_code.values
+        self._buf_rows += len(chunk.time)
+        if self._buf_rows >= self.buffer_timesteps:
+            self._flush(aligned=True)
+
+    def _empty_buffer(self) -> Dict[str, List[np.ndarray]]:
+        return {name: [] for name in ["time"] + self._trajectory_variables}
+
+    def _flush(self, aligned: bool = False):
+        """
+        hand the buffered chunks off to the writer thread
+        :param aligned: only hand off timesteps up to the last hdf5 chunk boundary along time, keeping the rest
+            buffered, so that compressed chunks are written whole instead of being re-read, inflated, and re-deflated.
+        """
+        num_rows = self._buf_rows
+        if aligned:
+            boundary = (self._t_written + num_rows) // self.chunk_timesteps
+            num_rows = boundary * self.chunk_timesteps - self._t_written
+        if num_rows <= 0:
+            return
+        # the handle is only ever used by one thread at a time: the previous batch must finish first
+        self._wait_for_write()
+        if not self._vars:
+            self._vars = {
+                name: self._dataset.variables[name]
+                for name in ["time", "exit_code"] + self._trajectory_variables
+            }
+
+        # only the last buffered chunk can be large (e.g. a whole kernel chunk); the ones before it are short.
+        # The hdf5 chunk straddling the two is assembled by copying, the rest of the last one is written in place.
+        short_rows = self._buf_rows - len(self._buf["time"][-1])
+        split = 0
+        if short_rows > 0:
+            # first hdf5 chunk boundary at or after the end of the short chunks (ceiling division)
+            next_boundary = -(-(self._t_written + short_rows) // self.chunk_timesteps)
+            split = min(
+                num_rows, next_boundary * self.chunk_timesteps - self._t_written
             )
+        spans = [
+            (start, stop)
+            for start, stop in [(0, split), (split, num_rows)]
+            if start < stop
+        ]
+        batches = [
+            (
+                self._t_written + start,
+                {
+                    name: _take_timesteps(pieces, start, stop)
+                    for name, pieces in self._buf.items()
+                },
+            )
+            for start, stop in spans
+        ]
+        # the remainder is copied, so that the chunks it came from can be freed
+        self._buf = {
+            name: (
+                [_take_timesteps(pieces, num_rows, self._buf_rows).copy()]
+                if self._buf_rows > num_rows
+                else []
+            )
+            for name, pieces in self._buf.items()
+        }
+        self._buf_rows -= num_rows
+        self._pending_write = self._exec.submit(
+            self._write_buffer, self._vars, batches, self._buf_exit_code
+        )
+        self._t_written += num_rows
 
-            lon = ds.variables["lon"]
-            lon[:, start_t:] = chunk.lon.values
-
-            lat = ds.variables["lat"]
-            lat[:, start_t:] = chunk.lat.values
+    def _wait_for_write(self):
+        """block until the writer thread is idle, re-raising any exception it encountered"""
+        if self._pending_write is not None:
+            pending, self._pending_write = self._pending_write, None
+            pending.result()
 
-            exit_code = ds.variables["exit_code"]
-            # overwrite with most recent codes; by design, nonzero codes cannot change
-            exit_code[:] = chunk.exit_code.values
+    def _write_buffer(
+        self,
+        variables: Dict[str, netCDF4.Variable],
+        batches: List[Tuple[int, Dict[str, np.ndarray]]],
+        exit_code: np.ndarray,
+    ):
+        """write batches of buffered timesteps to the outputfile, each at its start timestep, one write per variable"""
+        # libhdf5 is not threadsafe, and xarray/dask may be reading forcing data concurrently;
+        # take the same lock xarray's netCDF4 backend holds around its own library calls
+        with NETCDF4_PYTHON_LOCK:
+            for start_t, batch in batches:
+                variables["time"][start_t:] = batch["time"]
+                for name in self._trajectory_variables:
+                    variables[name][:, start_t:] = batch[name]
+            # only touch the span of codes which changed; typically few particles exit per chunk.
+            # one contiguous write, since netCDF4 issues a separate put per element of a fancy index
+            exit_codes = exit_code.astype(np.byte)
+            changed = np.flatnonzero(exit_codes != self._last_exit_codes)
+            if changed.size > 0:
+                span = slice(changed[0], changed[-1] + 1)
+                variables["exit_code"][span] = exit_codes[span]
+                self._last_exit_codes = exit_codes
+            # the handle stays open all year; flush hdf5 metadata so a killed run still leaves a readable file
+            self._ds.sync()
 
 
 class OutputWriter2D(OutputWriter):
@@ -231,6 +567,10 @@ class OutputWriter3D(OutputWriter):
         api_entry: str,
         api_arguments: dict,
         overwrite_existing_files: bool,
+        compression_level: int = 1,
+        chunk_timesteps: int = 64,
+        buffer_timesteps: Optional[int] = None,
+        keep_in_memory: bool = False,
     ):
         """
         :param configfile: configfile, to be copied to outputfiles
@@ -244,6 +584,10 @@ class OutputWriter3D(OutputWriter):
             api_entry=api_entry,
             api_arguments=api_arguments,
             overwrite_existing_files=overwrite_existing_files,
+            compression_level=compression_level,
+            chunk_timesteps=chunk_timesteps,
+            buffer_timesteps=buffer_timesteps,
+            keep_in_memory=keep_in_memory,
         )
         self.configfile = configfile
 
@@ -251,36 +595,41 @@ class OutputWriter3D(OutputWriter):
         super()._write_first_chunk(chunk=chunk)
 
         # --- SAVE MODEL CONFIGURATION METADATA INTO GROUPS --- #
-        self.configfile.to_netcdf(self.paths[-1], mode="a", group=CONFIGFILE_GROUP_NAME)
+        _copy_xr_to_nc4_group(
+            self.configfile, self._dataset.createGroup(CONFIGFILE_GROUP_NAME)
+        )
 
-        with netCDF4.Dataset(self.paths[-1], mode="a") as ds:
-            # --- INITIALIZE PARTICLE TRAJECTORIES IN ROOT GROUP --- #
-            radius = ds.createVariable("radius", np.float64, ("p_id",))
-            radius.units = "meters"
-            radius[:] = chunk.radius.values.astype(np.float64)
+        # --- INITIALIZE PARTICLE TRAJECTORIES IN ROOT GROUP --- #
+        ds = self._dataset
+        radius = ds.createVariable("radius", np.float64, ("p_id",))
+        radius.units = "meters"
+        radius[:] = chunk.radius.values.astype(np.float64, copy=False)
 
-            density = ds.createVariable("density", np.float64, ("p_id",))
-            density.units = "kg m^-3"
-            density[:] = chunk.density.values.astype(np.float64)
+        density = ds.createVariable("density", np.float64, ("p_id",))
+        density.units = "kg m^-3"
+        density[:] = chunk.density.values.astype(np.float64, copy=False)
 
-            corey_shape_factor = ds.createVariable(
-                "corey_shape_factor", np.float64, ("p_id",)
-            )
-            corey_shape_factor.units = "unitless"
-            corey_shape_factor[:] = chunk.corey_shape_factor.values.astype(np.float64)
+        corey_shape_factor = ds.createVariable(
+            "corey_shape_factor", np.float64, ("p_id",)
+        )
+        corey_shape_factor.units = "unitless"
+        corey_shape_factor[:] = chunk.corey_shape_factor.values.astype(
+            np.float64, copy=False
+        )
 
-            depth = ds.createVariable("depth", chunk.depth.dtype, ("p_id", "time"))
-            depth.units = "meters"
-            depth.positive = "up"
-            depth[:] = chunk.depth.values
+        depth = ds.createVariable(
+            "depth",
+            chunk.depth.dtype,
+            ("p_id", "time"),
+            **self._trajectory_storage(chunk, "depth"),
+        )
+        depth.units = "meters"
+        depth.positive = "up"
+        depth[:] = chunk.depth.values
 
-    def _append_chunk(self, chunk: xr.Dataset):
-        with netCDF4.Dataset(self.paths[-1], mode="a") as ds:
-            start_t = len(ds.variables["time"])
-        super()._append_chunk(chunk=chunk)
-        with netCDF4.Dataset(self.paths[-1], mode="a") as ds:
-            depth = ds.variables["depth"]
-            depth[:, start_t:] = chunk.depth.values
+    @property
+    def _trajectory_variables(self) -> List[str]:
+        return ["lon", "lat", "depth"]
 
     def _get_ocean_domain(self, forcing_data: Dict[Forcing, xr.Dataset]) -> xr.Dataset:
         return (
@@ -22,7 +22,7 @@ from dask.diagnostics import ProgressBar
 from .drivers.chunked_kernel_driver import execute_chunked_kernel_computation
 from .enums.advection_scheme import AdvectionScheme
 from .enums.forcings import Forcing
-from .io_tools.OutputWriter import OutputWriter2D
+from .io_tools.OutputWriter import OutputWriter2D, fits_in_memory
 from .io_tools.open_sourcefiles import open_2d_sourcefiles
 from .io_tools.open_vectorfiles import *
 from .kernel_wrappers.Kernel2D import Kernel2D, Kernel2DConfig
@@ -49,6 +49,7 @@ def run_advector_2D(
     wind_preprocessor: Optional[Callable[[xr.Dataset], xr.Dataset]] = None,
     sourcefile_preprocessor: Optional[Callable[[xr.Dataset], xr.Dataset]] = None,
     overwrite_existing_files: bool = False,
+    keep_output_in_memory: Optional[bool] = False,
 ) -> List[str]:
     """
     :param sourcefile_path: path to the particle sourcefile netcdf file.
@@ -98,6 +99,9 @@ def run_advector_2D(
     :param sourcefile_preprocessor: see water_preprocessor, compliance info in sourcefile_specifications.md
     :param overwrite_existing_files: flag to skip warning prompts and clobber existing files,
         useful for running model with no possibility of user input
+    :param keep_output_in_memory: hold each year of output in memory and write each outputfile in one go, rather than
+        streaming it to disk chunk by chunk.  Faster for small runs, but a crash loses the current year's output.
+        If None, this is enabled when the trajectories are small enough to fit comfortably in RAM.
     :return: list of paths to the outputfiles
     """
     if show_progress_bar:
@@ -129,6 +133,13 @@ def run_advector_2D(
             u_path=u_wind_path, v_path=v_wind_path, preprocessor=wind_preprocessor
         )
 
+    if keep_output_in_memory is None:
+        keep_output_in_memory = fits_in_memory(
+            num_particles=len(p0.p_id),
+            num_saved_timesteps=num_timesteps // save_period,
+            num_trajectory_variables=2,
+        )
+
     output_writer = OutputWriter2D(
         out_dir=Path(output_directory),
         basename="ADVECTOR_2D_output",
@@ -137,25 +148,28 @@ def run_advector_2D(
         api_entry="src/run_advector_2D.py::run_advector_2D",
         api_arguments=arguments,
         overwrite_existing_files=overwrite_existing_files,
+        keep_in_memory=keep_output_in_memory,
     )
 
     print("---COMMENCING ADVECTION---")
-    out_paths = execute_chunked_kernel_computation(
-        forcing_data=forcing_data,
-        kernel_cls=Kernel2D,
-        kernel_config=Kernel2DConfig(
-            advection_scheme=scheme_enum,
-            windage_coefficient=windage_coeff,
-            eddy_diffusivity=eddy_diffusivity,
-        ),
-        output_writer=output_writer,
-        p0=p0,
-        start_time=advection_start_date,
-        dt=timestep,
-        num_timesteps=num_timesteps,
-        save_every=save_period,
-        platform_and_device=opencl_device,
-        memory_utilization=memory_utilization,
-    )
+    # closes the outputfile and writer thread, even if advection fails
+    with output_writer:
+        out_paths = execute_chunked_kernel_computation(
+            forcing_data=forcing_data,
+            kernel_cls=Kernel2D,
+            kernel_config=Kernel2DConfig(
+                advection_scheme=scheme_enum,
+                windage_coefficient=windage_coeff,
+                eddy_diffusivity=eddy_diffusivity,
+            ),
+            output_writer=output_writer,
+            p0=p0,
+            start_time=advection_start_date,
+            dt=timestep,
+            num_timesteps=num_timesteps,
+            save_every=save_period,
+            platform_and_device=opencl_device,
+            memory_utilization=memory_utilization,
+        )
 
     return [str(p) for p in out_paths]
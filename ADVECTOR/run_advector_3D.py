@@ -23,7 +23,7 @@ from dask.diagnostics import ProgressBar
 from .drivers.chunked_kernel_driver import execute_chunked_kernel_computation
 from .enums.advection_scheme import AdvectionScheme
 from .enums.forcings import Forcing
-from .io_tools.OutputWriter import OutputWriter3D
+from .io_tools.OutputWriter import OutputWriter3D, fits_in_memory
 from .io_tools.open_configfiles import unpack_configfile
 from .io_tools.open_sourcefiles import open_3d_sourcefiles
 from .io_tools.open_vectorfiles import *
@@ -55,6 +55,7 @@ def run_advector_3D(
     seawater_density_preprocessor: Optional[Callable[[xr.Dataset], xr.Dataset]] = None,
     sourcefile_preprocessor: Optional[Callable[[xr.Dataset], xr.Dataset]] = None,
     overwrite_existing_files: bool = False,
+    keep_output_in_memory: Optional[bool] = False,
 ) -> List[str]:
     """
     :param sourcefile_path: path to the particle sourcefile netcdf file.
@@ -104,6 +105,9 @@ def run_advector_3D(
     :param sourcefile_preprocessor: see water_preprocessor, compliance info in sourcefile_specifications.md
     :param overwrite_existing_files: flag to skip warning prompts and clobber existing files,
         useful for running model with no possibility of user input
+    :param keep_output_in_memory: hold each year of output in memory and write each outputfile in one go, rather than
+        streaming it to disk chunk by chunk.  Faster for small runs, but a crash loses the current year's output.
+        If None, this is enabled when the trajectories are small enough to fit comfortably in RAM.
     :return: list of paths to the outputfiles
     """
     if show_progress_bar:
@@ -150,6 +154,13 @@ def run_advector_3D(
             u_path=u_wind_path, v_path=v_wind_path, preprocessor=wind_preprocessor
         )
 
+    if keep_output_in_memory is None:
+        keep_output_in_memory = fits_in_memory(
+            num_particles=len(p0.p_id),
+            num_saved_timesteps=num_timesteps // save_period,
+            num_trajectory_variables=3,
+        )
+
     output_writer = OutputWriter3D(
         out_dir=Path(output_directory),
         basename="ADVECTOR_3D_output",
@@ -159,28 +170,31 @@ def run_advector_3D(
         api_entry="src/run_advector_3D.py::run_advector_3D",
         api_arguments=arguments,
         overwrite_existing_files=overwrite_existing_files,
+        keep_in_memory=keep_output_in_memory,
     )
 
     print("---COMMENCING ADVECTION---")
-    out_paths = execute_chunked_kernel_computation(
-        forcing_data=forcing_data,
-        kernel_cls=Kernel3D,
-        kernel_config=Kernel3DConfig(
-            advection_scheme=scheme_enum,
-            eddy_diffusivity=eddy_diffusivity,
-            max_wave_height=max_wave_height,
-            wave_mixing_depth_factor=wave_mixing_depth_factor,
-            windage_multiplier=windage_multiplier,
-            wind_mixing_enabled=wind_mixing_enabled,
-        ),
-        output_writer=output_writer,
-        p0=p0,
-        start_time=advection_start_date,
-        dt=timestep,
-        num_timesteps=num_timesteps,
-        save_every=save_period,
-        platform_and_device=opencl_device,
-        memory_utilization=memory_utilization,
-    )
+    # closes the outputfile and writer thread, even if advection fails
+    with output_writer:
+        out_paths = execute_chunked_kernel_computation(
+            forcing_data=forcing_data,
+            kernel_cls=Kernel3D,
+            kernel_config=Kernel3DConfig(
+                advection_scheme=scheme_enum,
+                eddy_diffusivity=eddy_diffusivity,
+                max_wave_height=max_wave_height,
+                wave_mixing_depth_factor=wave_mixing_depth_factor,
+                windage_multiplier=windage_multiplier,
+                wind_mixing_enabled=wind_mixing_enabled,
+            ),
+            output_writer=output_writer,
+            p0=p0,
+            start_time=advection_start_date,
+            dt=timestep,
+            num_timesteps=num_timesteps,
+            save_every=save_period,
+            platform_and_device=opencl_device,
+            memory_utilization=memory_utilization,
+        )
 
     return [str(p) for p in out_paths]
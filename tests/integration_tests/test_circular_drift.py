@@ -24,16 +24,17 @@ lon = np.linspace(-0.02, 0.02, nx * 2)  # .01 degrees at equator ~= 1 km
 lat = np.linspace(-0.01, 0.01, nx)
 
 LON, LAT = np.meshgrid(lon, lat)
-mag = np.sqrt(LON ** 2 + LAT ** 2)
-U = np.divide(-LAT, mag, out=np.zeros_like(LON), where=mag != 0)
-V = np.divide(LON, mag, out=np.zeros_like(LON), where=mag != 0)
+mag = np.hypot(LON, LAT)
+with np.errstate(divide="ignore", invalid="ignore"):
+    U = np.where(mag != 0, -LAT / mag, 0.0)
+    V = np.where(mag != 0, LON / mag, 0.0)
 
 
 def compare_alg_drift_3d(initial_radius: float, plot=False):
     current = xr.Dataset(
         {
-            "U": (["lat", "lon", "depth", "time"], U[:, :, np.newaxis, np.newaxis]),
-            "V": (["lat", "lon", "depth", "time"], V[:, :, np.newaxis, np.newaxis]),
+            "U": (["lat", "lon", "depth", "time"], U.reshape(*U.shape, 1, 1)),
+            "V": (["lat", "lon", "depth", "time"], V.reshape(*V.shape, 1, 1)),
             "W": (["lat", "lon", "depth", "time"], np.zeros((*U.shape, 1, 1))),
             "bathymetry": (
                 ["lat", "lon"],
@@ -48,17 +49,20 @@ def compare_alg_drift_3d(initial_radius: float, plot=False):
         },
     )
 
-    p0 = pd.DataFrame(
+    dt = timedelta(seconds=30)
+    time = pd.date_range(start="2000-01-01", end="2000-01-01T6:00:00", freq=dt)
+    p0 = xr.Dataset(
         {
-            "p_id": [0],
-            "lon": [0],
-            "lat": [initial_radius],
-            "depth": [0],
-            "radius": [0.001],
-            "density": [1025],
-            "corey_shape_factor": [1],
-            "exit_code": [0],
-        }
+            "lon": ("p_id", [0]),
+            "lat": ("p_id", [initial_radius]),
+            "depth": ("p_id", [0]),
+            "radius": ("p_id", [0.001]),
+            "density": ("p_id", [1025]),
+            "corey_shape_factor": ("p_id", [1]),
+            "exit_code": ("p_id", [0]),
+            "release_date": ("p_id", time[:1]),
+        },
+        coords={"p_id": [0]},
     )
     eddy_diffusivity = xr.Dataset(
         {
@@ -82,10 +86,6 @@ def compare_alg_drift_3d(initial_radius: float, plot=False):
         },
     )
 
-    dt = timedelta(seconds=30)
-    time = pd.date_range(start="2000-01-01", end="2000-01-01T6:00:00", freq=dt)
-    p0["release_date"] = time[0]
-    p0 = xr.Dataset(p0.set_index("p_id"))
     save_every = 1
 
     euler, taylor = [
@@ -135,8 +135,8 @@ def plot_trajectory(euler, taylor, current, p0):
 def compare_alg_drift_2d(initial_radius: float, plot=False):
     current = xr.Dataset(
         {
-            "U": (["lat", "lon", "time"], U[:, :, np.newaxis]),
-            "V": (["lat", "lon", "time"], V[:, :, np.newaxis]),
+            "U": (["lat", "lon", "time"], U.reshape(*U.shape, 1)),
+            "V": (["lat", "lon", "time"], V.reshape(*V.shape, 1)),
         },
         coords={
             "lon": lon,
@@ -145,14 +145,17 @@ def compare_alg_drift_2d(initial_radius: float, plot=False):
         },
     )
 
-    p0 = pd.DataFrame(
-        {"p_id": [0], "lon": [0], "lat": [initial_radius], "exit_code": [0]}
-    )
-
     dt = timedelta(seconds=30)
     time = pd.date_range(start="2000-01-01", end="2000-01-01T6:00:00", freq=dt)
-    p0["release_date"] = time[0]
-    p0 = xr.Dataset(p0.set_index("p_id"))
+    p0 = xr.Dataset(
+        {
+            "lon": ("p_id", [0]),
+            "lat": ("p_id", [initial_radius]),
+            "exit_code": ("p_id", [0]),
+            "release_date": ("p_id", time[:1]),
+        },
+        coords={"p_id": [0]},
+    )
     save_every = 1
 
     euler, taylor = [
@@ -0,0 +1,264 @@
+from pathlib import Path
+
+import netCDF4
+import numpy as np
+import pandas as pd
+import pytest
+import xarray as xr
+
+from ADVECTOR.enums.forcings import Forcing
+from ADVECTOR.io_tools.OutputWriter import (
+    CONFIGFILE_GROUP_NAME,
+    MODEL_DOMAIN_GROUP_NAME,
+    SOURCEFILE_GROUP_NAME,
+    TRAJECTORY_CHUNK_BYTES,
+    OutputWriter,
+    OutputWriter2D,
+    OutputWriter3D,
+    fits_in_memory,
+)
+
+NUM_PARTICLES = 7
+# 2-hourly output starting the last day of 2000; chunk bounds chosen so one chunk straddles new year
+TIME = pd.date_range("2000-12-31T00", periods=60, freq="2h")
+CHUNK_BOUNDS = [0, 5, 10, 30, 31, 60]
+
+
+def make_forcing_data(is_3d: bool) -> dict:
+    U = np.ones((4, 5, 2))
+    U[0, 0, :] = np.nan
+    current = xr.Dataset(
+        {"U": (["lat", "lon", "time"], U)},
+        coords={
+            "lon": np.arange(5.0),
+            "lat": np.arange(4.0),
+            "time": pd.date_range("2000-01-01", periods=2),
+        },
+        attrs={"title": "test currents"},
+    )
+    if is_3d:
+        current["bathymetry"] = (["lat", "lon"], -np.ones((4, 5)))
+    return {Forcing.current: current}
+
+
+def make_chunks(is_3d: bool) -> list:
+    """a sequence of kernel-output-like chunks, in which a couple of particles exit partway through"""
+    rng = np.random.default_rng(0)
+    chunks = []
+    for i in range(len(CHUNK_BOUNDS) - 1):
+        time = TIME[CHUNK_BOUNDS[i] : CHUNK_BOUNDS[i + 1]]
+        exit_code = np.zeros(NUM_PARTICLES, dtype=np.int8)
+        exit_code[3] = 1 if i >= 2 else 0
+        exit_code[5] = 2 if i >= 4 else 0
+        trajectory_vars = ["lon", "lat", "depth"] if is_3d else ["lon", "lat"]
+        data = {
+            name: (
+                ["p_id", "time"],
+                rng.random((NUM_PARTICLES, len(time))).astype(np.float32),
+            )
+            for name in trajectory_vars
+        }
+        data.update(
+            {
+                "release_date": (
+                    "p_id",
+                    np.full(NUM_PARTICLES, np.datetime64("2000-12-30", "ns")),
+                ),
+                "exit_code": ("p_id", exit_code),
+                "extra": ("p_id", np.arange(NUM_PARTICLES, dtype=np.float32)),
+            }
+        )
+        if is_3d:
+            data.update(
+                {
+                    "radius": ("p_id", np.full(NUM_PARTICLES, 1e-3)),
+                    "density": ("p_id", np.full(NUM_PARTICLES, 1000.0)),
+                    "corey_shape_factor": ("p_id", np.full(NUM_PARTICLES, 0.5)),
+                }
+            )
+        chunks.append(
+            xr.Dataset(data, coords={"p_id": np.arange(NUM_PARTICLES), "time": time})
+        )
+    return chunks
+
+
+def make_writer(out_dir: Path, is_3d: bool, **kwargs) -> OutputWriter:
+    sourcefile = xr.Dataset(
+        {
+            "lon": ("p_id", np.zeros(NUM_PARTICLES)),
+            "lat": ("p_id", np.zeros(NUM_PARTICLES)),
+            "name": ("p_id", np.array(["a"] * NUM_PARTICLES)),
+        },
+        coords={"p_id": np.arange(NUM_PARTICLES)},
+    )
+    # as if read from a compressed sourcefile; lat as if since concatenated with another
+    compressed = {"zlib": True, "complevel": 4, "shuffle": True, "chunksizes": (4,)}
+    sourcefile.lon.encoding = {**compressed, "original_shape": (NUM_PARTICLES,)}
+    sourcefile.lat.encoding = {**compressed, "original_shape": (2 * NUM_PARTICLES,)}
+    common = dict(
+        out_dir=out_dir,
+        basename="out",
+        sourcefile=sourcefile,
+        forcing_data=make_forcing_data(is_3d),
+        api_entry="test",
+        api_arguments={},
+        overwrite_existing_files=True,
+        **kwargs,
+    )
+    if is_3d:
+        configfile = xr.Dataset({"a": ("z", [1.0, 2.0])}, coords={"z": [0, 1]})
+        return OutputWriter3D(configfile=configfile, **common)
+    return OutputWriter2D(**common)
+
+
+def write_chunks(out_dir: Path, chunks: list, is_3d: bool, **kwargs) -> list:
+    with make_writer(out_dir, is_3d, **kwargs) as writer:
+        for chunk in chunks:
+            writer.write_output_chunk(chunk)
+    return writer.paths
+
+
+@pytest.mark.parametrize("is_3d", [False, True])
+@pytest.mark.parametrize(
+    "writer_kwargs",
+    [
+        {},
+        {"chunk_timesteps": 4},  # many small, boundary-aligned flushes
+        {"chunk_timesteps": 4, "buffer_timesteps": 1, "compression_level": 0},
+        # long enough that the particle axis is split across hdf5 chunks
+        {"chunk_timesteps": 2**14},
+        {"keep_in_memory": True},
+        {"keep_in_memory": True, "chunk_timesteps": 4},
+    ],
+)
+def test_round_trip(tmp_path, is_3d, writer_kwargs):
+    chunks = make_chunks(is_3d)
+    paths = write_chunks(tmp_path, chunks, is_3d, **writer_kwargs)
+
+    trajectory_vars = ["lon", "lat", "depth"] if is_3d else ["lon", "lat"]
+    expected = xr.concat([c[trajectory_vars] for c in chunks], dim="time")
+    years = expected.time.dt.year
+    chunk_timesteps = writer_kwargs.get("chunk_timesteps", 64)
+    compression_level = writer_kwargs.get("compression_level", 1)
+    assert [p.name for p in paths] == ["out_2000.nc", "out_2001.nc"]
+
+    for year, path in zip((2000, 2001), paths):
+        expected_year = expected.isel(time=(years == year).values)
+        # exit codes are those of the last chunk to contribute to this year
+        last_chunk = [c for c in chunks if (c.time.dt.year == year).any()][-1]
+
+        with xr.open_dataset(path) as out:
+            np.testing.assert_array_equal(out.time, expected_year.time)
+            for name in trajectory_vars:
+                np.testing.assert_array_equal(out[name], expected_year[name])
+            np.testing.assert_array_equal(out.exit_code, last_chunk.exit_code)
+            np.testing.assert_array_equal(out.release_date, chunks[0].release_date)
+            np.testing.assert_array_equal(out.extra, chunks[0].extra)
+            if is_3d:
+                np.testing.assert_array_equal(out.radius, chunks[0].radius)
+
+        with netCDF4.Dataset(path) as ds:
+            groups = set(ds.groups)
+            for name in trajectory_vars:
+                chunk_p = TRAJECTORY_CHUNK_BYTES // (
+                    ds[name].dtype.itemsize * chunk_timesteps
+                )
+                assert ds[name].chunking() == [
+                    min(NUM_PARTICLES, chunk_p),
+                    chunk_timesteps,
+                ]
+                assert ds[name].filters()["zlib"] == (compression_level > 0)
+            for name in ["time", "release_date"]:
+                assert ds[name].dtype == np.int64
+            # sourcefile variables stay compressed; their chunking is kept unless they were reshaped since read
+            sourcefile = ds[SOURCEFILE_GROUP_NAME]
+            for name in ["lon", "lat"]:
+                assert sourcefile[name].filters()["zlib"]
+                assert sourcefile[name].filters()["complevel"] == 4
+            assert sourcefile["lon"].chunking() == [4]
+            assert sourcefile["lat"].chunking() != [4]
+        assert {
+            MODEL_DOMAIN_GROUP_NAME,
+            SOURCEFILE_GROUP_NAME,
+            "current_meta",
+        } <= groups
+        assert (CONFIGFILE_GROUP_NAME in groups) == is_3d
+
+        with xr.open_dataset(path, group=SOURCEFILE_GROUP_NAME) as sourcefile:
+            np.testing.assert_array_equal(sourcefile.name, ["a"] * NUM_PARTICLES)
+        with xr.open_dataset(path, group="current_meta") as meta:
+            np.testing.assert_array_equal(
+                meta.time, make_forcing_data(is_3d)[Forcing.current].time
+            )
+
+
+def test_keep_in_memory_writes_each_year_once(tmp_path):
+    chunks = make_chunks(is_3d=False)
+    with make_writer(tmp_path, is_3d=False, keep_in_memory=True) as writer:
+        for chunk in chunks[:3]:
+            writer.write_output_chunk(chunk)
+        # the chunk spanning new year rolled the writer over to 2001, which is still in memory
+        assert [p.exists() for p in writer.paths] == [True, False]
+        with xr.open_dataset(writer.paths[0]) as out:
+            assert len(out.time) == (TIME.year == 2000).sum()
+
+        for chunk in chunks[3:]:
+            writer.write_output_chunk(chunk)
+        assert not writer.paths[1].exists()
+    with xr.open_dataset(writer.paths[1]) as out:
+        np.testing.assert_array_equal(out.exit_code, chunks[-1].exit_code)
+
+
+def test_fits_in_memory():
+    assert fits_in_memory(10_000, 1_000, num_trajectory_variables=3)
+    assert not fits_in_memory(1_000_000, 10_000, num_trajectory_variables=2)
+
+
+def test_append_copies_only_partial_hdf5_chunks(tmp_path, monkeypatch):
+    time = pd.date_range("2000-01-01", periods=105, freq="h")
+    chunks = [
+        xr.Dataset(
+            {
+                "lon": (["p_id", "time"], np.zeros((NUM_PARTICLES, stop - start))),
+                "lat": (["p_id", "time"], np.zeros((NUM_PARTICLES, stop - start))),
+                "release_date": ("p_id", np.full(NUM_PARTICLES, time[0])),
+                "exit_code": ("p_id", np.zeros(NUM_PARTICLES, dtype=np.int8)),
+            },
+            coords={"p_id": np.arange(NUM_PARTICLES), "time": time[start:stop]},
+        )
+        for start, stop in [(0, 3), (3, 5), (5, 105)]
+    ]
+    concatenated_lengths = []
+    np_concatenate = np.concatenate
+
+    def concatenate(arrays, axis=0):
+        concatenated_lengths.extend(a.shape[axis] for a in arrays)
+        return np_concatenate(arrays, axis=axis)
+
+    with make_writer(
+        tmp_path, is_3d=False, chunk_timesteps=8, buffer_timesteps=4
+    ) as writer:
+        writer.write_output_chunk(chunks[0])
+        monkeypatch.setattr(np, "concatenate", concatenate)
+        for chunk in chunks[1:]:
+            writer.write_output_chunk(chunk)
+        monkeypatch.undo()
+        # the large chunk is only sliced into, and its leftover timesteps are buffered as a copy
+        assert max(concatenated_lengths) <= 8
+        assert not np.shares_memory(writer._buf["lon"][0], chunks[-1].lon.values)
+    with xr.open_dataset(writer.paths[0]) as out:
+        np.testing.assert_array_equal(out.time, time)
+
+
+def test_writer_thread_shut_down_when_close_fails(tmp_path, monkeypatch):
+    writer = make_writer(tmp_path, is_3d=False)
+
+    def close():
+        raise OSError("disk full")
+
+    monkeypatch.setattr(writer, "close", close)
+    with pytest.raises(OSError):
+        with writer:
+            pass
+    with pytest.raises(RuntimeError):
+        writer._exec.submit(print)